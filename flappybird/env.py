@@ -101,8 +101,10 @@ class FlappyBirdEnv(gym.Env):
 
         2.将图像转换为灰度图像
         '''
-        downsample_frame = PIL.Image.fromarray(o_frame).resize((72, 128)).convert(mode='L')
-        output_frame = np.asarray(downsample_frame).astype(np.uint8)
+        # 显式指定resample，保证Pillow与Pillow-SIMD下得到相同的observation（两者的该滤波器都有SIMD优化）
+        downsample_frame = PIL.Image.fromarray(o_frame).resize((72, 128), resample=PIL.Image.BICUBIC).convert(mode='L')
+        # convert(mode='L')得到的图像已经是np.uint8，np.asarray()直接使用其数据，不再额外复制一份
+        output_frame = np.asarray(downsample_frame)
         # output_frame[output_frame <= 1.] = 0.0
         # output_frame[output_frame > 1.] = 1.0
         # output_frame = output_frame.astype(np.uint8)
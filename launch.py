@@ -9,6 +9,9 @@ from logger.observer import ConsoleLoggerOberver, FileLoggerObserver
 from main_processes import ProgramManager
 from settings.loader import TrainingSettingLoader
 
+# 日志中记录的位置，即本文件名
+_THIS_FILE = os.path.basename(__file__)
+
 parser = argparse.ArgumentParser(description='2Mode-FlappyBird')
 
 
@@ -53,10 +56,14 @@ train_argument_group.add_argument('--max_episode', type=int,
                                   default=20000)
 train_argument_group.add_argument('--resume', action='store_true', default=False,
                                   help='whether to start training based on model given (finetuning model)',)
+train_argument_group.add_argument('--torch_compile', action='store_true', default=False,
+                                  help='compile the q-networks with torch.compile() to speed up training (falls back to torch.jit.script before PyTorch 2.0)')
 train_argument_group.add_argument('--test_model_freq', type=int,
                                   help='episode interval to test model during training phase', default=100)
 train_argument_group.add_argument('--save_checkpoint_freq', type=int,
                                   help='episode interval to save checkpoint', default=2000)
+train_argument_group.add_argument('--train_freq', type=int,
+                                  help='number of frames between two updates of the q-network', default=4)
 
 
 if __name__ == '__main__':
@@ -82,23 +89,23 @@ if __name__ == '__main__':
     if not args.train and (args.model_path == '' or args.model_path is None):
         program_manager.generate_log(message='argument --model not received, launch game at human mode',
                                      level='info',
-                                     location=os.path.split(__file__)[1])
+                                     location=_THIS_FILE)
         program_manager.play_game(player='human')
     # 测试cuda是否可用
     elif args.cuda and not torch.cuda.is_available():
         program_manager.generate_log(message='Error: CUDA is not available, maybe you should not set --cuda',
                                      level='error',
-                                     location=os.path.split(__file__)[1])
+                                     location=_THIS_FILE)
         sys.exit(1)
     # 由模型在游戏环境中游玩或训练
     else:
         program_manager.generate_log(message='launch program with a model given',
                                      level='info',
-                                     location=os.path.split(__file__)[1])
+                                     location=_THIS_FILE)
         if args.cuda:
             program_manager.generate_log(message='run program with GPU support',
                                          level='info',
-                                         location=os.path.split(__file__)[1])
+                                         location=_THIS_FILE)
         if args.train:
             """
             从json文件和运行参数中导入设置
@@ -2,23 +2,27 @@ import sys
 import os
 import time
 import copy
+import contextlib
 
 import numpy as np
-import PIL.Image
-from torch.autograd import Variable
 import torch
 import torch.nn
 import torch.optim
 
 from rl_module.agent import FlappyAgent
 from rl_module.custom_enum import NetStruct, ExplorationMethod
+from rl_module.env_worker import EnvWorker
 from rl_module.file import FileHandler
 from rl_module.nn import FlappyDuelingQNet, FlappyQNet
+from rl_module.preprocess import preprocess_frame
 from rl_module.replay import ReplayMemory
 from logger.subject import LoggerSubject
 import flappybird.settings
 from flappybird.game_manager import GameManager as FlappyBirdGameManager
 
+# 日志中记录的位置，即本文件名
+_THIS_FILE = os.path.basename(__file__)
+
 
 class ProgramManager(LoggerSubject):
     '''
@@ -44,14 +48,11 @@ class ProgramManager(LoggerSubject):
 
         2.将图像转换为灰度图像
 
-        3.将图像每个像素的灰度值映射为0或1
+        3.将图像每个像素的灰度值映射为0或1，以np.uint8存储
         '''
-        # TODO: 解释为什么这里的降采样尺寸是(72, 128)，而创建空Tensor时采用(128, 72)
-        resize_frame = PIL.Image.fromarray(frame).resize(image_size_after_resize).convert(mode='L')
-        out = np.asarray(resize_frame).astype(np.float32)
-        out[out <= 1.] = 0.0
-        out[out > 1.] = 1.0
-        return out
+        # 游戏画面数组的尺寸为(288, 512, 3)，numpy把它当作288行、512列的图像
+        # image_size_after_resize沿用PIL的(宽, 高)写法，所以输出数组的尺寸为(128, 72)，与网络输入一致
+        return preprocess_frame(frame, image_size_after_resize)
 
     def load_training_setting(self, setting):
         '''
@@ -81,9 +82,7 @@ class ProgramManager(LoggerSubject):
         """
         初始化Agent，用于选择动作
         """
-        agent = FlappyAgent(
-            memory_size=self.training_setting.memory_size,
-            device=self.device)
+        agent = FlappyAgent(device=self.device)
 
         """
         检查训练过程是否基于一个给定的模型开始
@@ -92,12 +91,12 @@ class ProgramManager(LoggerSubject):
         """
         if self.training_setting.resume:
             self.generate_log(message='load previous model weight: {}'.format(self.training_setting.model_path),
-                              level='info', location=os.path.split(__file__)[1])
+                              level='info', location=_THIS_FILE)
             try:
                 checkpoint = self.file_handler.load(self.training_setting.model_path)
             except BaseException as e:
                 self.generate_log(message='Error raised when loading model. Type: {}, Description: {}'.format(type(e), e),
-                                  level='error', location=os.path.split(__file__)[1])
+                                  level='error', location=_THIS_FILE)
                 sys.exit(1)
             # 根据网络结构信息，初始化指定结构的网络
             if checkpoint.get('network_structure', NetStruct.NORMAL) == NetStruct.DUELING:
@@ -112,208 +111,284 @@ class ProgramManager(LoggerSubject):
             else:
                 variable_qnetwork = FlappyQNet().to(self.device)
 
-        # 初始化target q-network
+        # 使用GPU训练时，网络参数与输入都采用channels_last(NHWC)的内存格式，卷积可以直接使用Tensor Core，省去格式转换
+        memory_format = torch.channels_last if self.training_setting.cuda else torch.contiguous_format
+        variable_qnetwork = variable_qnetwork.to(memory_format=memory_format)
+
+        # 初始化target q-network，它只用于计算y，不需要梯度
+        # 之后只用load_state_dict()把variable_qnetwork的参数复制过来，不再重新创建网络
         target_qnetwork = copy.deepcopy(variable_qnetwork).to(self.device)
+        target_qnetwork.requires_grad_(False)
+        target_qnetwork.eval()
+
+        """
+        训练时计算Q值所用的网络
+        如果开启了torch_compile，用torch.compile()编译variable_qnetwork与target_qnetwork，融合卷积、激活等运算的kernel
+        minibatch的尺寸固定，编译结果可以一直复用；pytorch 2.0之前没有torch.compile()，改用TorchScript
+        编译后的网络与原网络共享参数；选择动作、保存参数、更新target_qnetwork时仍然使用未编译的网络
+        """
+        if self.training_setting.torch_compile:
+            if hasattr(torch, 'compile'):
+                training_qnetwork = torch.compile(variable_qnetwork, mode='reduce-overhead', fullgraph=True)
+                training_target_qnetwork = torch.compile(target_qnetwork, mode='reduce-overhead', fullgraph=True)
+            else:
+                training_qnetwork = torch.jit.script(variable_qnetwork)
+                training_target_qnetwork = torch.jit.script(target_qnetwork)
+        else:
+            training_qnetwork = variable_qnetwork
+            training_target_qnetwork = target_qnetwork
 
         # 初始化优化器和损失函数
         optimizer = torch.optim.RMSprop(variable_qnetwork.parameters(), lr=self.training_setting.lr)
         ceriterion = torch.nn.MSELoss()
 
-        # 初始化游戏
-        game_render_setting = flappybird.settings.RenderSetting()
-        game_render_setting.set_mode('hidden')
-        flappyBird_game_manager = FlappyBirdGameManager(game_render_setting)
-        flappyBird_game_manager.set_player_computer()
+        # 使用GPU训练时开启混合精度：前向传播在autocast下以float16计算，GradScaler缩放loss以免梯度下溢
+        use_amp = self.training_setting.cuda
+        scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
 
-        """
-        训练开始前，随机选取action操作小鸟，并将数据保存起来
-        随机操作的次数取决于training_setting.observation
-        """
-        action = [1, 0]
-        o, r, terminal = flappyBird_game_manager.frame_step(action)
-        o = self.frame_preprocess(o)
-        agent.reset_state()
-        for i in range(self.training_setting.observation):
-            current_state = agent.current_state
-            action = agent.get_action_based_on_fixed_pr()
-            o, r, terminal = flappyBird_game_manager.frame_step(action)
-            o = self.frame_preprocess(o)
-            next_state = agent.update_current_state(o)
-            self.replay_memory.push(current_state, action, r, next_state, terminal)
-
-        # start training
-        flappyBird_game_manager.game_reset()
-        epsilon = self.training_setting.epsilon_greedy.init_e
-
-        flag_update_target_qnetwork = 0
-
-        # 注意episode从0开始编号，所以训练次数可以在max_episode的基础上+1，否则最后的一部分训练结果没有机会保存下来
-        for episode in range(self.training_setting.max_episode + 1):
-            agent.time_step = 0
-            agent.reset_state()
-            total_reward = 0.
-            # ------beginning of an episode------
-            while True:
-                # 模型依据自身经验决定这一帧采取的action，传入gamestate，获得这一帧的观测图像、奖励值、游戏是否中止
-                # 决定action的方法受到exploration方式的影响，目前支持Epsilon Greedy和Boltzmann Exploration
-                action = agent.get_action_based_on_exploration(
-                    variable_qnetwork,
-                    exploration_method=ExplorationMethod.BOLTZMANN_EXPLORATION if self.training_setting.exploration_method == 'Boltzmann Exploration' else ExplorationMethod.EPSILON_GREEDY,
-                    epsilon=epsilon)
-                o_next, r, terminal = flappyBird_game_manager.frame_step(action)
-                total_reward += self.training_setting.gamma**agent.time_step * r
-
-                # 对这一帧图像做预处理
-                o_next = self.frame_preprocess(o_next)
-
-                current_state = agent.current_state
-                next_state = agent.update_current_state(o_next)
-
-                # 保存数据，模型的time_step计数器+1
-                self.replay_memory.push(current_state, action, r, next_state, terminal)
-                agent.increase_time_step()
+        # 初始化游戏，游戏在子进程中运行，返回的是预处理后的帧图像
+        env_worker = EnvWorker()
+        # 训练过程中出现异常（包括用Ctrl+C中止训练）时，也要关闭子进程、释放共享内存
+        try:
+            """
+            训练开始前，随机选取action操作小鸟，并将数据保存起来
+            随机操作的次数取决于training_setting.observation
+            回放池只保存每一帧图像，采样时自行拼接状态，所以这一阶段不需要维护agent的当前状态，得到的帧直接写入回放池
+            """
+            env_worker.step(0)
+            replay_push = self.replay_memory.push
+            get_random_action = agent.get_action_based_on_fixed_pr
+            for i in range(self.training_setting.observation):
+                action = get_random_action()
+                o, r, terminal = env_worker.step(action)
+                replay_push(o, action, r, terminal, episode_start=(i == 0))
 
-                # Step 1: obtain random minibatch from replay memory
-                minibatch = self.replay_memory.sample(self.training_setting.batch_size)
-                state_batch = np.array([data[0] for data in minibatch])
-                action_batch = np.array([data[1] for data in minibatch])
-                reward_batch = np.array([data[2] for data in minibatch])
-                next_state_batch = np.array([data[3] for data in minibatch])
+            # start training
+            env_worker.reset()
+            epsilon = self.training_setting.epsilon_greedy.init_e
 
-                state_batch_var = Variable(torch.from_numpy(state_batch)).to(self.device)
-                with torch.no_grad():
-                    next_state_batch_var = Variable(torch.from_numpy(next_state_batch)).to(self.device)
+            flag_update_target_qnetwork = 0
+            flag_train = 0
 
-                """
-                Step 2: calculate y
-                """
+            """
+            预先分配存放minibatch状态的Tensor，每次训练直接把回放池中的数据写入其中，不再为每个minibatch重新分配内存
+            使用GPU训练时，这些Tensor位于锁页内存中，可以异步复制到显存
+            batch_copied记录上一次异步复制完成的时刻，在改写这些Tensor之前需要等待复制完成
+            state与next_state在同一块连续内存中（前一半为state，后一半为next_state），只需复制一次，也可以直接一起输入网络
+            帧图像只有0和1两种取值，这些Tensor保持np.uint8，复制到self.device之后再转换为网络需要的float32，复制的数据量只有原来的1/4
+            """
+            batch_size = self.training_setting.batch_size
+            both_state_batch_host = torch.empty((2 * batch_size,) + FlappyAgent.empty_state.shape,
+                                                dtype=torch.uint8, pin_memory=self.training_setting.cuda)
+            state_batch_host, next_state_batch_host = both_state_batch_host[:batch_size], both_state_batch_host[batch_size:]
+            # 动作下标、奖励值、游戏是否未结束，同样预先分配在锁页内存中，与状态一起异步复制
+            action_batch_host = torch.empty(batch_size, dtype=torch.int64, pin_memory=self.training_setting.cuda)
+            reward_batch_host = torch.empty(batch_size, dtype=torch.float32, pin_memory=self.training_setting.cuda)
+            not_terminal_batch_host = torch.empty(batch_size, dtype=torch.bool, pin_memory=self.training_setting.cuda)
+            batch_copied = torch.cuda.Event() if self.training_setting.cuda else None
+            # 使用GPU训练时，在单独的stream中复制minibatch，复制与默认stream中尚未完成的上一次训练的计算可以同时进行
+            copy_stream = torch.cuda.Stream() if self.training_setting.cuda else None
 
-                r"""
-                计算variable_qnetwork的Q值$Q(s_i, a_i)$与目标y值，更新网络权重使Q接近y（回归问题）
-                原始方法：
-                $y = r_t + \underset{a}{max}\hat{Q}(s_{t+1}, a)$
-                进阶方法(Double DQN)：
-                $y = r_t + Q'(s_{t+1}, arg\underset{a}{max}Q(s_{t+1}, a))$
-                """
-                q_of_next_state = variable_qnetwork(next_state_batch_var)
-                y = reward_batch.astype(np.float32)
-
-                if 'Double DQN' in self.training_setting.advanced_method:
-                    # max_q.shape: Tensor([32])
-                    # max_q_index.shape: Tensor([32]), max_q_index每个位置的值只会是0或1
-                    # target_qnetwork.forward(next_state_batch_var).shape: Tensor([32, 2]), 二维数组
-                    # 用二维索引的方式，把target_qnetwork算出的Q表里，每行指定索引位置的值取出来
-                    # recalculated_q.shape: Tensor([32])
-                    _, max_q_index = torch.max(q_of_next_state, dim=1)
-                    # TODO: 下面这个索引方式有无更好的方式代替
-                    recalculated_q = target_qnetwork(next_state_batch_var)[torch.arange(
-                        0, self.training_setting.batch_size), max_q_index]
-                    for i in range(self.training_setting.batch_size):
-                        if not minibatch[i][4]:
-                            y[i] += self.training_setting.gamma * recalculated_q.data[i].item()
-                else:
-                    max_q, _ = torch.max(q_of_next_state, dim=1)
-
-                    for i in range(self.training_setting.batch_size):
-                        if not minibatch[i][4]:
-                            y[i] += self.training_setting.gamma * max_q.data[i].item()
-
-                action_batch_var = Variable(torch.from_numpy(action_batch)).to(self.device)
-                q_of_current_state = variable_qnetwork(state_batch_var)
-                q_of_current_state = torch.sum(torch.mul(action_batch_var, q_of_current_state), dim=1)
-                y = Variable(torch.from_numpy(y)).to(self.device)
-
-                # 更新网络参数
-                loss = ceriterion(q_of_current_state, y)
-                optimizer.zero_grad()
-                loss.backward()
-                optimizer.step()
+            """
+            Double DQN中，是否用一次前向传播同时算出variable_qnetwork对state与next_state的Q值
+            使用GPU时，小batch的耗时主要在于kernel的启动次数，合并后启动次数减半
+            使用CPU时，耗时主要在于计算量，合并后反向传播要多处理一半全为0的梯度，反而更慢，所以仍分两次计算
+            """
+            merge_forward = self.training_setting.cuda
+
+            # 循环中反复用到的设置项、对象与方法，事先取出保存为局部变量，避免每一帧都查找属性
+            device = self.device
+            device_type = device.type
+            replay_sample = self.replay_memory.sample
+            gamma = self.training_setting.gamma
+            train_freq = self.training_setting.train_freq
+            update_target_qnetwork_freq = self.training_setting.update_target_qnetwork_freq
+            exploration_method = ExplorationMethod.BOLTZMANN_EXPLORATION \
+                if self.training_setting.exploration_method == 'Boltzmann Exploration' else ExplorationMethod.EPSILON_GREEDY
+            use_double_dqn = 'Double DQN' in self.training_setting.advanced_method
+            final_e = self.training_setting.epsilon_greedy.final_e
+            # 每个episode之后epsilon的下降量
+            epsilon_delta = (self.training_setting.epsilon_greedy.init_e - final_e) / self.training_setting.exploration
+
+            # 注意episode从0开始编号，所以训练次数可以在max_episode的基础上+1，否则最后的一部分训练结果没有机会保存下来
+            for episode in range(self.training_setting.max_episode + 1):
+                agent.time_step = 0
+                agent.reset_state()
+                total_reward = 0.
+                # 当前这一帧奖励值的折扣系数，即gamma**time_step，每一帧乘以gamma，不必每次求幂
+                discount = 1.
+                # ------beginning of an episode------
+                while True:
+                    # 模型依据自身经验决定这一帧采取的action，传入gamestate，获得这一帧的观测图像、奖励值、游戏是否中止
+                    # 决定action的方法受到exploration方式的影响，目前支持Epsilon Greedy和Boltzmann Exploration
+                    action = agent.get_action_based_on_exploration(
+                        variable_qnetwork,
+                        exploration_method=exploration_method,
+                        epsilon=epsilon)
+                    # 游戏在子进程中执行这一帧、预处理帧图像，与此同时主进程训练网络
+                    env_worker.step_async(action)
+
+                    # 每与环境交互train_freq次，才训练一次网络（计数器跨episode累计），减少反向传播的次数
+                    if (flag_train := ((flag_train + 1) % train_freq)) == 0:
+                        # Step 1: obtain random minibatch from replay memory
+                        # 回放池中的状态以np.uint8存储，直接写入预先分配的Tensor
+                        if batch_copied is not None:
+                            batch_copied.synchronize()
+                        _, action_batch, reward_batch, _, terminal_batch = replay_sample(
+                            batch_size,
+                            state_out=state_batch_host.numpy(),
+                            next_state_out=next_state_batch_host.numpy())
+                        action_batch_host.numpy()[:] = action_batch
+                        reward_batch_host.numpy()[:] = reward_batch
+                        np.logical_not(terminal_batch, out=not_terminal_batch_host.numpy())
+
+                        with torch.cuda.stream(copy_stream) if copy_stream is not None else contextlib.nullcontext():
+                            both_state_batch_device = both_state_batch_host.to(device, non_blocking=True)
+                            action_batch_var = action_batch_host.to(device, non_blocking=True)
+                            reward_batch_var = reward_batch_host.to(device, non_blocking=True)
+                            not_terminal_batch_var = not_terminal_batch_host.to(device, non_blocking=True)
+                        if copy_stream is not None:
+                            batch_copied.record(copy_stream)
+                            # 默认stream中的计算要等复制完成后才能开始；这些Tensor在copy_stream中分配，需告知分配器它们也在默认stream中使用
+                            compute_stream = torch.cuda.current_stream()
+                            compute_stream.wait_stream(copy_stream)
+                            for tensor in (both_state_batch_device, action_batch_var, reward_batch_var, not_terminal_batch_var):
+                                tensor.record_stream(compute_stream)
+
+                        both_state_batch_var = both_state_batch_device.float().contiguous(memory_format=memory_format)
+                        state_batch_var, next_state_batch_var = both_state_batch_var[:batch_size], both_state_batch_var[batch_size:]
+
+                        # 计算state的Q值；Double DQN还需要variable_qnetwork给出的next_state的Q值，用于选择动作
+                        with torch.autocast(device_type=device_type, dtype=torch.float16, enabled=use_amp):
+                            if merge_forward and use_double_dqn:
+                                # next_state的Q值只用于计算y，需要从计算图中分离出来
+                                q_of_both_state = training_qnetwork(both_state_batch_var)
+                                q_of_current_state = q_of_both_state[:batch_size]
+                                q_of_next_state = q_of_both_state[batch_size:].detach()
+                            else:
+                                q_of_current_state = training_qnetwork(state_batch_var)
+                                if use_double_dqn:
+                                    with torch.no_grad():
+                                        q_of_next_state = training_qnetwork(next_state_batch_var)
+
+                        """
+                        Step 2: calculate y
+                        """
+
+                        r"""
+                        计算variable_qnetwork的Q值$Q(s_i, a_i)$与目标y值，更新网络权重使Q接近y（回归问题）
+                        原始方法：
+                        $y = r_t + \underset{a}{max}\hat{Q}(s_{t+1}, a)$
+                        进阶方法(Double DQN)：
+                        $y = r_t + \hat{Q}(s_{t+1}, arg\underset{a}{max}Q(s_{t+1}, a))$
+                        其中$\hat{Q}$为target_qnetwork，$Q$为variable_qnetwork
+                        """
+                        # y只作为回归目标，不需要梯度；整个计算都在device上向量化完成，不再逐个元素调用.item()
+                        with torch.no_grad(), torch.autocast(device_type=device_type, dtype=torch.float16, enabled=use_amp):
+                            # target_qnetwork算出的next_state的Q值, shape: Tensor([32, 2])
+                            q_of_next_state_target = training_target_qnetwork(next_state_batch_var)
+                            if use_double_dqn:
+                                # 由variable_qnetwork选择动作，max_q_index.shape: Tensor([32, 1])，每个位置的值只会是0或1
+                                # 再用gather从target_qnetwork的Q表里，取出每行该动作对应的值，max_q.shape: Tensor([32])
+                                max_q_index = q_of_next_state.argmax(dim=1, keepdim=True)
+                                max_q = q_of_next_state_target.gather(1, max_q_index).squeeze(1)
+                            else:
+                                max_q, _ = torch.max(q_of_next_state_target, dim=1)
+
+                            # 游戏结束的状态转移没有后续奖励，用掩码把对应位置的max_q置为0
+                            y = reward_batch_var + gamma * max_q * not_terminal_batch_var
+
+                        with torch.autocast(device_type=device_type, dtype=torch.float16, enabled=use_amp):
+                            # 按动作下标取出每条记录实际所选动作的Q值，不必先乘one-hot再求和
+                            q_of_current_state = q_of_current_state.gather(1, action_batch_var.unsqueeze(1)).squeeze(1)
+                            loss = ceriterion(q_of_current_state, y)
+
+                        # 更新网络参数，梯度直接置为None，由下一次反向传播重新写入，不必先清零
+                        optimizer.zero_grad(set_to_none=True)
+                        scaler.scale(loss).backward()
+                        scaler.step(optimizer)
+                        scaler.update()
+
+                        """
+                        每经过一定次数的更新，将target_qnetwork的参数更新为当前variable_qnetwork的参数
+                        """
+                        if (flag_update_target_qnetwork := ((flag_update_target_qnetwork + 1) %
+                                                            update_target_qnetwork_freq)) == 0:
+                            target_qnetwork.load_state_dict(variable_qnetwork.state_dict())
+
+                    o_next, r, terminal = env_worker.step_wait()
+                    total_reward += discount * r
+                    discount *= gamma
+
+                    agent.update_current_state(o_next)
+
+                    # 保存数据，模型的time_step计数器+1
+                    # 回放池只保存最新的一帧，time_step为0说明这是本episode的第一条记录
+                    replay_push(o_next, action, r, terminal, episode_start=(agent.time_step == 0))
+                    agent.increase_time_step()
+
+                    # when the bird dies, the episode ends
+                    if terminal:
+                        break
+
+                # ------end of an episode------
+
+                self.generate_log(message='episode: {}, epsilon: {:.4f}, max time step: {}, total reward: {:.6f}'.format(
+                    episode, epsilon, agent.time_step, total_reward),
+                    level='info', location=_THIS_FILE)
+
+                # 经过一次episode后，降低epsilon的值
+                if epsilon > final_e:
+                    epsilon -= epsilon_delta
 
                 """
-                每经过一定次数的更新，将target_qnetwork更新为当前的variable_qnetwork
+                每经过一定次数的episode，测试训练后模型的效果(具体次数为training_setting.test_model_freq，默认值见程序入口)
+                如果训练后的模型效果经过估计优于训练前的模型，将其保存起来，并且接下来的训练过程基于这个新的模型进行
+                否则，按照training_setting.save_checkpoint_freq的值，每隔一定数量的episode保存一次模型，不管这个模型是否是当前最优的
                 """
-                if (flag_update_target_qnetwork := ((flag_update_target_qnetwork + 1) %
-                                                    self.training_setting.update_target_qnetwork_freq)) == 0:
-                    target_qnetwork = copy.deepcopy(variable_qnetwork)
-
-                # when the bird dies, the episode ends
-                if terminal:
-                    break
-
-            # ------end of an episode------
-
-            self.generate_log(message='episode: {}, epsilon: {:.4f}, max time step: {}, total reward: {:.6f}'.format(
-                episode, epsilon, agent.time_step, total_reward),
-                level='info', location=os.path.split(__file__)[1])
+                test_model = episode % self.training_setting.test_model_freq == 0
+                save_checkpoint = episode % self.training_setting.save_checkpoint_freq == 0
+                # 评估模型要完整地玩数局游戏，只在需要时评估，并且每个episode至多评估一次；两者都不需要时直接进入下一个episode
+                need_eval = test_model or save_checkpoint
 
-            # 经过一次episode后，降低epsilon的值
-            if epsilon > self.training_setting.epsilon_greedy.final_e:
-                delta = (self.training_setting.epsilon_greedy.init_e - self.training_setting.epsilon_greedy.final_e) / \
-                    self.training_setting.exploration
-                epsilon -= delta
-
-            """
-            每经过一定次数的episode，测试训练后模型的效果(具体次数为training_setting.test_model_freq，默认值见程序入口)
-            如果训练后的模型效果经过估计优于训练前的模型，将其保存起来，并且接下来的训练过程基于这个新的模型进行
-            否则，按照training_setting.save_checkpoint_freq的值，每隔一定数量的episode保存一次模型，不管这个模型是否是当前最优的
-            """
-            # 用于查看当前episode是否保存了检查点的标志变量
-            checkpoint_saved = False
-            # 用于检查当前episode的模型是否被评估的标志变量
-            model_evaluated = False
-
-            # case1: 测试模型
-            if episode % self.training_setting.test_model_freq == 0:
-                if not model_evaluated:
-                    avg_time_step = self.evaluate_avg_time_step(agent, variable_qnetwork)
+                if need_eval:
+                    avg_time_step = self.evaluate_avg_time_step(agent, variable_qnetwork, env_worker)
                     self.generate_log(message='testing: episode: {}, average time step: {}'.format(
                         episode, avg_time_step),
-                        level='info', location=os.path.split(__file__)[1])
-                    model_evaluated = True
-                if avg_time_step > best_time_step:
-                    best_time_step = avg_time_step
+                        level='info', location=_THIS_FILE)
                     model_dict = {
                         'episode': episode,
                         'epsilon': epsilon,
                         'state_dict': variable_qnetwork.state_dict(),
                         'network_structure': NetStruct.DUELING if isinstance(variable_qnetwork, FlappyDuelingQNet) else NetStruct.NORMAL,
-                        'time_step': best_time_step,
+                        'time_step': avg_time_step,
                     }
-                    self.file_handler.save(model_dict, name='checkpoint-episode-%d.pth.tar' % episode)
-                    checkpoint_saved = True
-                    self.generate_log(message='save the best checkpoint by far, episode={}, average time step={:.2f}'.format(
-                        episode, avg_time_step),
-                        level='info', location=os.path.split(__file__)[1])
-                    # 把当前最佳的模型信息另外在根目录保存一份
-                    self.file_handler.save(model_dict, 'model_best.pth.tar', './')
-
-            # case2: 保存检查点
-            if episode % self.training_setting.save_checkpoint_freq == 0 and not checkpoint_saved:
-                if not model_evaluated:
-                    avg_time_step = self.evaluate_avg_time_step(agent, variable_qnetwork)
-                    self.generate_log(message='testing: episode: {}, average time step: {}'.format(
-                        episode, avg_time_step),
-                        level='info', location=os.path.split(__file__)[1])
-                    model_evaluated = True
-                model_dict = {
-                    'episode': episode,
-                    'epsilon': epsilon,
-                    'state_dict': variable_qnetwork.state_dict(),
-                    'network_structure': NetStruct.DUELING if isinstance(variable_qnetwork, FlappyDuelingQNet) else NetStruct.NORMAL,
-                    'time_step': avg_time_step,
-                }
-                self.file_handler.save(model_dict, name='checkpoint-episode-%d.pth.tar' % episode)
-                self.generate_log(message='save a checkpoint at a preset frequency, episode={}, average time step={:.2f}'.format(
-                    episode, avg_time_step),
-                    level='info', location=os.path.split(__file__)[1])
-                checkpoint_saved = True
-
-            # case3: 不评估，继续下一个episode
-            else:
-                continue
-        pass
 
-    def evaluate_avg_time_step(self, agent: FlappyAgent, network: torch.nn.Module, test_episode_num=45):
+                    # case1: 测试模型，当前模型优于之前最好的模型时保存
+                    if test_model and avg_time_step > best_time_step:
+                        best_time_step = avg_time_step
+                        # 同一份参数要保存两次，只序列化一次
+                        model_data = self.file_handler.serialize(model_dict)
+                        self.file_handler.write(model_data, name='checkpoint-episode-%d.pth.tar' % episode)
+                        self.generate_log(message='save the best checkpoint by far, episode={}, average time step={:.2f}'.format(
+                            episode, avg_time_step),
+                            level='info', location=_THIS_FILE)
+                        # 把当前最佳的模型信息另外在根目录保存一份
+                        self.file_handler.write(model_data, 'model_best.pth.tar', './')
+
+                    # case2: 保存检查点（本episode已经保存过最佳模型时不再重复保存）
+                    elif save_checkpoint:
+                        self.file_handler.save(model_dict, name='checkpoint-episode-%d.pth.tar' % episode)
+                        self.generate_log(message='save a checkpoint at a preset frequency, episode={}, average time step={:.2f}'.format(
+                            episode, avg_time_step),
+                            level='info', location=_THIS_FILE)
+
+            # 检查点在后台线程中写入磁盘，训练结束前等待所有写入完成
+            self.file_handler.wait()
+        finally:
+            env_worker.close()
+
+    def evaluate_avg_time_step(self, agent: FlappyAgent, network: torch.nn.Module, env_worker: EnvWorker, test_episode_num=45):
         '''
         评估当前模型在数次游戏中坚持的平均时间，用于测试当前模型的游戏效果
 
@@ -326,26 +401,23 @@ class ProgramManager(LoggerSubject):
         目前设定n=45，舍弃最好与最差的10次，试图降低某些极端情况的影响
 
         :param agent: 智能体
-        :param episode: current training episode
+        :param network: 用于选择动作的网络
+        :param env_worker: 运行游戏的子进程，与训练共用同一个游戏，评估结束时游戏处于中止状态，下一次执行动作时会自动重置
         :returns avg_time_step: 模型在n次游戏中坚持的平均时间
         '''
         time_step_list = []
-        game_render_setting = flappybird.settings.RenderSetting()
-        game_render_setting.set_mode('hidden')
-        flappyBird_game_manager = FlappyBirdGameManager(game_render_setting)
-        flappyBird_game_manager.set_player_computer()
+        # 评估与训练共用子进程中的游戏，不必另外创建游戏、初始化pygame、加载素材；返回的帧图像已经过预处理
+        env_worker.reset()
 
         for test_case in range(test_episode_num):
             agent.time_step = 0
             agent.reset_state()
-            observation_frame, reward, terminal = flappyBird_game_manager.frame_step([1, 0])
-            observation_frame = self.frame_preprocess(observation_frame)
+            env_worker.step(0)
             while True:
                 action = agent.get_optim_action(network)
-                observation_frame, reward, terminal = flappyBird_game_manager.frame_step(action)
+                observation_frame, reward, terminal = env_worker.step(action)
                 if terminal:
                     break
-                observation_frame = self.frame_preprocess(observation_frame)
                 agent.update_current_state(observation_frame)
                 agent.increase_time_step()
             time_step_list.append(agent.time_step)
@@ -386,12 +458,12 @@ class ProgramManager(LoggerSubject):
         """
         self.generate_log(
             message='Load pretrained model file: ' + model_file_path,
-            level='info', location=os.path.split(__file__)[1])
+            level='info', location=_THIS_FILE)
         try:
             checkpoint = self.file_handler.load(model_file_path)
         except BaseException as e:
             self.generate_log(message='Error raised when loading model. Type: {}, Description: {}'.format(type(e), e),
-                              level='error', location=os.path.split(__file__)[1])
+                              level='error', location=_THIS_FILE)
             sys.exit(1)
 
         # 根据网络结构信息，初始化指定结构的网络
@@ -399,10 +471,11 @@ class ProgramManager(LoggerSubject):
             qnetwork = FlappyDuelingQNet().to(device)
         else:
             qnetwork = FlappyQNet().to(device)
-        # 加载网络参数
+        # 加载网络参数，这里只用网络选择动作，切换为eval模式
         qnetwork.load_state_dict(checkpoint.get('state_dict', None))
+        qnetwork.eval()
 
-        agent = FlappyAgent(0, device)
+        agent = FlappyAgent(device)
         agent.reset_state()
 
         # 初始化游戏
@@ -410,12 +483,14 @@ class ProgramManager(LoggerSubject):
         game_render_setting.set_mode('human')
         flappyBird_game_manager = FlappyBirdGameManager(game_render_setting)
         flappyBird_game_manager.set_player_computer()
+        # agent给出的是动作的下标，游戏需要的是one-hot形式的动作
+        action_to_game = ([1, 0], [0, 1])
 
         while True:
             # agent选择动作
             action = agent.get_optim_action(qnetwork)
             # 与游戏环境交互，拿到观测到的一帧图像、奖励，得知游戏是否停止
-            observation_frame, reward, terminal = flappyBird_game_manager.frame_step(action)
+            observation_frame, reward, terminal = flappyBird_game_manager.frame_step(action_to_game[action])
             if terminal:
                 break
             # 更新agent当前观测的状态
@@ -426,4 +501,4 @@ class ProgramManager(LoggerSubject):
 
         self.generate_log(
             message='total time step is {}'.format(agent.time_step),
-            level='info', location=os.path.split(__file__)[1])
+            level='info', location=_THIS_FILE)
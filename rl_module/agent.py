@@ -3,10 +3,8 @@ import random
 import numpy as np
 import torch
 import torch.nn
-from torch.autograd import Variable
 
 from .custom_enum import ExplorationMethod
-from .replay import ReplayMemory
 
 
 class FlappyAgent():
@@ -15,51 +13,59 @@ class FlappyAgent():
     '''
 
     """
-    初始化一个数组，尺寸128*72，数据类型np.float32
+    初始化一个数组，尺寸128*72，数据类型np.uint8（与预处理后的帧图像一致）
     初始化一个“状态”，由四个数组在axis=0处叠加得到
     推测empty_frame代表一帧画面，empty_state代表由连续的4帧组成的一个状态
     """
-    empty_frame = np.zeros((128, 72), dtype=np.float32)
+    empty_frame = np.zeros((128, 72), dtype=np.uint8)
     empty_state = np.stack(
         (empty_frame, empty_frame, empty_frame, empty_frame),
         axis=0
     )
 
-    def __init__(self, memory_size: int, device: torch.device):
+    def __init__(self, device: torch.device):
         self.actions = 2  # 游戏动作空间（可执行的动作数量）
-        self.memory = ReplayMemory(memory_size)  # 经验回放池
         self.device = device
 
         # agent与环境交互的时间步
         self.time_step = 0
 
-        self.reset_state()
+        # 当前状态，每个agent持有自己的一块数组，之后只在原地修改
+        self.current_state = FlappyAgent.empty_state.copy()
+        # 把当前状态输入网络时使用的Tensor，预先在指定设备上分配好，每一帧只需把数据复制进去
+        self.state_var = torch.empty((1,) + FlappyAgent.empty_state.shape, dtype=torch.float32, device=self.device)
 
     def reset_state(self):
         '''
         重置目前的状态
         '''
-        self.current_state = FlappyAgent.empty_state
+        self.current_state[:] = FlappyAgent.empty_state
 
     def update_current_state(self, new_frame):
         '''
         更新当前状态
         '''
         # 把当前state（4帧图像）最早的一帧去除，加上从游戏得到的最新的一帧图像，作为下一个state
-        self.current_state = np.append(
-            self.current_state[1:, :, :], new_frame.reshape((1,) + new_frame.shape),
-            axis=0
-        )
+        # 在原地把后3帧前移一位，再写入最新一帧，不必每一帧都重新分配整个state
+        self.current_state[:-1] = self.current_state[1:]
+        self.current_state[-1] = new_frame
         return self.current_state
 
+    def get_current_state_var(self):
+        '''
+        把当前状态写入预先分配好的Tensor（同时转换为float32），作为网络的输入
+        :returns state_var: 尺寸为(1, 4, 128, 72)的Tensor
+        '''
+        self.state_var.copy_(torch.from_numpy(self.current_state))
+        return self.state_var
+
     def get_action_based_on_fixed_pr(self, pr_of_flapping=0.075):
         '''
         依据预设的固定概率，从动作空间中随机选择一个动作
         :param pr_of_flapping: 选择动作“拍翅膀”的概率
+        :returns action: 动作的下标（0：不拍翅膀，1：拍翅膀），下同
         '''
-        action = np.zeros(self.actions, dtype=np.uint8)
-        action[1 if random.random() < pr_of_flapping else 0] = 1
-        return action
+        return 1 if random.random() < pr_of_flapping else 0
 
     def get_optim_action(self, network: torch.nn.Module):
         '''
@@ -77,16 +83,15 @@ class FlappyAgent():
         尺寸：torch.Size([1, 2])
         q_value中的两个数值分别代表小鸟不拍翅膀和拍翅膀的预期收益
         每次采取最优动作时，会选取数值较大（即预期收益更高）的一个动作
-        eg. q_value = tensor([[15.4445,  2.2350]], device='cuda:0', grad_fn=<AddmmBackward0>)，则这一帧小鸟不拍翅膀的预期收益更高，最优选择就是不拍翅膀
+        eg. q_value = tensor([[15.4445,  2.2350]], device='cuda:0')，则这一帧小鸟不拍翅膀的预期收益更高，最优选择就是不拍翅膀
+
+        选择动作只需要前向传播，在torch.inference_mode()下计算，不构建计算图，也不记录张量的版本信息
         """
-        with torch.no_grad():
-            state_var = Variable(torch.from_numpy(self.current_state)).unsqueeze(0).to(self.device)
-        q_value = network(state_var)
-        _, action_index = torch.max(q_value, dim=1)
-        action_index = action_index.data[0].item()
-        action = np.zeros(self.actions, dtype=np.uint8)
-        action[action_index] = 1
-        return action
+        with torch.inference_mode():
+            state_var = self.get_current_state_var()
+            q_value = network(state_var)
+            _, action_index = torch.max(q_value, dim=1)
+        return action_index.item()
 
     def get_action_based_on_exploration(self, network: torch.nn.Module,
                                         exploration_method=ExplorationMethod.EPSILON_GREEDY, epsilon=1.0, tau=0.5):
@@ -115,8 +120,7 @@ class FlappyAgent():
                 action = self.get_optim_action(network)
 
         elif exploration_method == ExplorationMethod.BOLTZMANN_EXPLORATION:
-            with torch.no_grad():
-                state_var = Variable(torch.from_numpy(self.current_state)).unsqueeze(0).to(self.device)
+            state_var = self.get_current_state_var()
             """
             eg. q_value = tensor([[1.0, 2.0]]), tau = 0.5
             probability = exp(1.0/0.5) / (exp(1.0/0.5) + exp(2.0/0.5))
@@ -128,11 +132,11 @@ class FlappyAgent():
             实测这种方法运行速度不如自己求比例
             下面的算法是目前想到的算法中，经测试最快的
             """
-            q_value = network(state_var)
-            q_value_after_control = torch.exp(q_value / tau)
-            probability = (q_value_after_control / torch.sum(q_value_after_control))[0][0].item()
-            action = np.zeros(self.actions, dtype=np.float32)
-            action[0 if random.random() < probability else 1] = 1
+            with torch.inference_mode():
+                q_value = network(state_var)
+                q_value_after_control = torch.exp(q_value / tau)
+                probability = (q_value_after_control / torch.sum(q_value_after_control))[0][0].item()
+            action = 0 if random.random() < probability else 1
 
         else:
             raise ValueError('invalid exploration method when getting action')
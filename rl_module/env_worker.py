@@ -0,0 +1,129 @@
+import multiprocessing
+import signal
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import flappybird.settings
+from flappybird.game_manager import GameManager as FlappyBirdGameManager
+from .preprocess import preprocess_frame
+
+
+def run_worker(connection, shared_frame_name, frame_shape, render_mode):
+    '''
+    子进程的入口：运行游戏，把预处理后的帧图像写入共享内存，把奖励值与游戏是否中止通过管道发回主进程
+
+    :param connection: 与主进程通信的管道
+    :param shared_frame_name: 存放帧图像的共享内存名称
+    :param frame_shape: 预处理后一帧图像的尺寸
+    :param render_mode: 游戏渲染方式，见RenderSetting.set_mode()
+    '''
+    # 子进程与主进程在同一个进程组中，按下Ctrl+C时也会收到SIGINT；子进程忽略它，由主进程负责通知子进程退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    shared_frame = shared_memory.SharedMemory(name=shared_frame_name)
+    frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=shared_frame.buf)
+
+    game_render_setting = flappybird.settings.RenderSetting()
+    game_render_setting.set_mode(render_mode)
+    game_manager = FlappyBirdGameManager(game_render_setting)
+    game_manager.set_player_computer()
+
+    # 主进程传来的是动作的下标，游戏需要的是one-hot形式的动作
+    action_to_game = ([1, 0], [0, 1])
+
+    while True:
+        command, action = connection.recv()
+        if command == 'step':
+            observation_frame, reward, terminal = game_manager.frame_step(action_to_game[action])
+            frame[:] = preprocess_frame(observation_frame)
+            connection.send((reward, terminal))
+        elif command == 'reset':
+            game_manager.game_reset()
+            connection.send(None)
+        elif command == 'close':
+            break
+
+    del frame
+    shared_frame.close()
+    connection.close()
+
+
+class EnvWorker():
+    '''
+    在子进程中运行游戏并预处理帧图像
+
+    游戏运行与帧图像预处理都只占用CPU，放在子进程中执行后，主进程可以同时进行网络训练（例如在GPU上），
+    一帧的耗时从二者之和变为二者中较大的一个
+
+    用法：step_async()发出动作后立即返回，之后调用step_wait()取回这一帧的结果；step()则是二者的组合
+    '''
+
+    def __init__(self, frame_shape=(128, 72), render_mode='hidden'):
+        '''
+        :param frame_shape: 预处理后一帧图像的尺寸
+        :param render_mode: 游戏渲染方式，见RenderSetting.set_mode()
+        '''
+        self.shared_frame = shared_memory.SharedMemory(create=True, size=int(np.prod(frame_shape)))
+        # 子进程写入的帧图像，与共享内存共用同一块数据
+        self.frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=self.shared_frame.buf)
+
+        # 统一使用spawn方式创建子进程，避免fork时复制主进程中pytorch、pygame的状态
+        context = multiprocessing.get_context('spawn')
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_worker,
+            args=(child_connection, self.shared_frame.name, frame_shape, render_mode),
+            daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def step_async(self, action):
+        '''
+        把动作传给子进程中的游戏，不等待这一帧执行完毕
+
+        :param action: 动作的下标（0：不拍翅膀，1：拍翅膀）
+        '''
+        self.connection.send(('step', action))
+
+    def step_wait(self):
+        '''
+        等待step_async()传入的动作执行完毕，返回预处理后的帧图像、奖励值、游戏是否中止
+
+        注意：返回的帧图像是共享内存的视图，下一次调用step_async()之后会被改写，需要保留时请复制
+        '''
+        reward, terminal = self.connection.recv()
+        return self.frame, reward, terminal
+
+    def step(self, action):
+        '''
+        执行传入的动作，等待执行完毕并返回结果
+        '''
+        self.step_async(action)
+        return self.step_wait()
+
+    def reset(self):
+        '''
+        重置游戏
+        '''
+        self.connection.send(('reset', None))
+        self.connection.recv()
+
+    def close(self):
+        '''
+        关闭子进程，释放共享内存
+
+        训练出现异常时也会调用本方法，此时子进程可能已经退出，通知失败时直接结束子进程
+        '''
+        try:
+            self.connection.send(('close', None))
+            self.process.join(timeout=5)
+        except (BrokenPipeError, OSError):
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+        del self.frame
+        self.shared_frame.close()
+        self.shared_frame.unlink()
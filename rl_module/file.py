@@ -1,3 +1,5 @@
+import concurrent.futures
+import io
 import os
 import re
 
@@ -14,7 +16,23 @@ class FileHandler:
         self.folder_path = folder_path
         if not self.folder_path.endswith('/'):
             self.folder_path += '/'
-        pass
+
+        # 写磁盘的工作交给一个后台线程完成，训练过程不必等待磁盘IO
+        self.save_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.pending_saves = []
+
+    def serialize(self, model):
+        '''
+        将参数序列化为bytes
+
+        序列化在调用者的线程中完成，所以返回之后再修改模型参数，不会影响已经序列化的内容
+        模型很小，zip格式的打包开销占了保存时间的大部分，因此使用旧的pickle格式，torch.load()同样可以读取
+
+        :param model: model weight and other info binding by user
+        '''
+        buffer = io.BytesIO()
+        torch.save(model, buffer, _use_new_zipfile_serialization=False, pickle_protocol=5)
+        return buffer.getvalue()
 
     def save(self, model, name, folder: str = None):
         '''
@@ -24,6 +42,18 @@ class FileHandler:
         :param name: 文件命名
         :param folder: 文件夹路径
         '''
+        self.write(self.serialize(model), name, folder)
+
+    def write(self, data: bytes, name, folder: str = None):
+        '''
+        将序列化后的参数交给后台线程写入磁盘，不等待写入完成
+
+        同一份参数要保存到多个位置时，先调用serialize()，再多次调用本方法，避免重复序列化
+
+        :param data: serialize()的返回值
+        :param name: 文件命名
+        :param folder: 文件夹路径
+        '''
 
         # 处理文件名称
         illegal_char_re = '[\\\\/*?"<>|]'
@@ -37,10 +67,34 @@ class FileHandler:
                 folder += '/'
             save_folder = folder
 
+        # 检查之前已经完成的写入任务，写入失败时立即抛出异常，不必等到训练结束
+        self.check_finished_saves()
+        self.pending_saves.append(self.save_pool.submit(self._write_bytes, data, save_folder, name))
+
+    def check_finished_saves(self):
+        '''
+        清理已经完成的写入任务，如果其中有写入失败的任务，抛出它的异常
+        '''
+        finished_saves = [future for future in self.pending_saves if future.done()]
+        self.pending_saves = [future for future in self.pending_saves if not future.done()]
+        for future in finished_saves:
+            future.result()
+
+    def wait(self):
+        '''
+        等待所有后台写入任务完成，如果写入过程中出现异常，在这里抛出
+        '''
+        pending_saves, self.pending_saves = self.pending_saves, []
+        for future in pending_saves:
+            future.result()
+
+    @staticmethod
+    def _write_bytes(data, save_folder, name):
         os.makedirs(save_folder, exist_ok=True)
 
         # 保存文件至指定路径
-        torch.save(model, save_folder + name)
+        with open(save_folder + name, 'wb') as f:
+            f.write(data)
 
     def load(self, full_path):
         '''
@@ -55,7 +55,7 @@ class FlappyQNet(torch.nn.Module):
         after self.relu1, size: torch.Size([1, 32, 32, 18])
         after self.conv2, size: torch.Size([1, 64, 16, 9])
         after self.relu2, size: torch.Size([1, 64, 16, 9])
-        after out.view(out.size()[0], -1), size: torch.Size([1, 9216])
+        after out.reshape(out.size()[0], -1), size: torch.Size([1, 9216])
         after self.fc1, size: torch.Size([1, 256])
         after self.relu3, size: torch.Size([1, 256])
         after self.fc2, size: torch.Size([1, 2])
@@ -65,12 +65,13 @@ class FlappyQNet(torch.nn.Module):
         out = self.conv2(out)
         out = self.relu2(out)
         """
-        用torch.view()改变tensor尺寸，不改变数据
+        用torch.reshape()改变tensor尺寸，不改变数据
         改变前后各个维度上尺寸的乘积相等（数据量相等）
         -1 代表这个维度的尺寸由电脑自动计算
-        注意改变尺寸前后的tensor共享同一块内存
+        内存连续时与torch.view()相同，改变尺寸前后的tensor共享同一块内存
+        输入为channels_last格式时内存不连续，reshape()会按原来的维度顺序复制一份数据，view()则会报错
         """
-        out = out.view(out.size()[0], -1)
+        out = out.reshape(out.size()[0], -1)
         out = self.fc1(out)
         out = self.relu3(out)
         q_value = self.fc2(out)
@@ -131,7 +132,7 @@ class FlappyDuelingQNet(torch.nn.Module):
         after self.relu1, size: torch.Size([1, 32, 32, 18])
         after self.conv2, size: torch.Size([1, 64, 16, 9])
         after self.relu2, size: torch.Size([1, 64, 16, 9])
-        after out.view(out.size()[0], -1), size: torch.Size([1, 9216])
+        after out.reshape(out.size()[0], -1), size: torch.Size([1, 9216])
         after self.fc1, size: torch.Size([1, 256])
         after self.relu3, size: torch.Size([1, 256])
         after self.fc2_v, size: torch.Size([1, 1])
@@ -143,12 +144,13 @@ class FlappyDuelingQNet(torch.nn.Module):
         out = self.conv2(out)
         out = self.relu2(out)
         """
-        用torch.view()改变tensor尺寸，不改变数据
+        用torch.reshape()改变tensor尺寸，不改变数据
         改变前后各个维度上尺寸的乘积相等（数据量相等）
         -1 代表这个维度的尺寸由电脑自动计算
-        注意改变尺寸前后的tensor共享同一块内存
+        内存连续时与torch.view()相同，改变尺寸前后的tensor共享同一块内存
+        输入为channels_last格式时内存不连续，reshape()会按原来的维度顺序复制一份数据，view()则会报错
         """
-        out = out.view(out.size()[0], -1)
+        out = out.reshape(out.size()[0], -1)
         out = self.fc1(out)
         out = self.relu3(out)
         out_v = self.fc2_v(out)
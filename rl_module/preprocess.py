@@ -0,0 +1,44 @@
+import functools
+
+import numpy as np
+
+# 计算灰度值时RGB三个通道的权重，与PIL中convert(mode='L')采用的公式一致
+LUMINANCE_WEIGHT = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# 游戏画面数组的尺寸，即pygame.surfarray.array3d()的返回值尺寸
+GAME_FRAME_SHAPE = (288, 512, 3)
+
+
+@functools.lru_cache(maxsize=None)
+def gather_index(frame_shape, image_size_after_resize):
+    '''
+    计算降采样后每个像素的各个通道分别取自原图像展平后的哪个位置（最近邻采样）
+
+    :param frame_shape: 原图像的尺寸(行数, 列数, 通道数)
+    :param image_size_after_resize: 降采样后的尺寸(宽, 高)，与PIL.Image.resize()的参数含义相同
+    :returns index: 尺寸为(高, 宽, 通道数)的索引数组，可直接传给np.take()
+    '''
+    width, height = image_size_after_resize
+    rows = ((np.arange(height) + 0.5) * frame_shape[0] / height).astype(np.intp)
+    cols = ((np.arange(width) + 0.5) * frame_shape[1] / width).astype(np.intp)
+    pixel_index = rows[:, np.newaxis] * frame_shape[1] + cols
+    return pixel_index[..., np.newaxis] * frame_shape[2] + np.arange(frame_shape[2])
+
+
+def preprocess_frame(frame, image_size_after_resize=(72, 128)):
+    '''
+    对输入的帧图像做预处理：降采样、转换为灰度图像、把灰度值映射为0或1
+
+    降采样与取出像素合并为一次np.take()，只遍历一次需要的像素，不产生中间数组
+    输出只有0和1两种取值，所以用np.uint8存储，内存占用是np.float32的1/4，转换为Tensor时再变为浮点数
+
+    :param frame: 游戏画面，尺寸(288, 512, 3)，rgb彩色图像
+    :param image_size_after_resize: 降采样后的尺寸(宽, 高)
+    '''
+    index = gather_index(frame.shape, image_size_after_resize)
+    gray = np.take(frame.reshape(-1), index) @ LUMINANCE_WEIGHT
+    return (gray > 1.0).view(np.uint8)
+
+
+# 导入模块时预先计算游戏画面对应的索引，避免训练的第一帧才开始计算
+gather_index(GAME_FRAME_SHAPE, (72, 128))
@@ -1,32 +1,98 @@
-import random
-from collections import deque
+import numpy as np
 
 
 class ReplayMemory():
     '''
     经验回放池，存储Agent与环境交互时发生的状态转移过程，用于训练
+
+    一个状态由连续的4帧图像组成，相邻的两条状态转移记录有3帧是相同的
+    为了不重复保存同一帧图像，回放池只保存每次状态转移得到的最新一帧，采样时再根据帧的位置拼接出完整的状态
+    预处理后的帧图像只有0和1两种取值，所以每个像素压缩为1个bit保存（np.packbits），采样时再解压
+    所有数据都存放在预先分配好的环形数组中，回放池装满后，新记录会覆盖最旧的记录
     '''
 
-    def __init__(self, capacity):
-        self.memory = deque([], maxlen=capacity)
+    def __init__(self, capacity, frame_shape=(128, 72), history_length=4):
+        '''
+        :param capacity: 回放池最多保存的记录数量
+        :param frame_shape: 一帧图像的尺寸
+        :param history_length: 一个状态包含的帧数
+        '''
+        self.capacity = capacity
+        self.history_length = history_length
+
+        # 每条记录得到的最新一帧图像，按bit压缩保存
+        self.frame_shape = frame_shape
+        self.frame_size = int(np.prod(frame_shape))
+        self.frames = np.zeros((capacity, (self.frame_size + 7) // 8), dtype=np.uint8)
+        # 动作只保存其下标（0：不拍翅膀，1：拍翅膀），训练时直接用于从Q值中取出对应的一列
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.terminals = np.zeros(capacity, dtype=np.bool_)
+        # 每条记录是当前episode中的第几条记录（从0开始，最大记为history_length），用于在拼接状态时排除上一个episode的帧
+        self.episode_steps = np.zeros(capacity, dtype=np.int32)
+
+        # 下一条记录写入的位置，以及目前保存的记录数量
+        self.position = 0
+        self.size = 0
+
+        # 拼接状态时，每一帧相对于被采样记录的偏移量，从最早的一帧到最新的一帧
+        # 前history_length帧组成current_state，后history_length帧组成next_state
+        self.history_offset = np.arange(history_length, -1, -1)
 
-    def push(self, current_state, action, reward, next_state, terminal):
+    def push(self, frame, action, reward, terminal, episode_start=False):
         '''
         向回放池中添加一条状态转移记录
-        :param current_state: 当前状态
-        :param action: 选择的动作
+        :param frame: 执行动作后得到的一帧图像，即next_state中最新的一帧
+        :param action: 选择的动作的下标
         :param reward: 得到的奖励
-        :param next_state: 下一状态
         :param terminal: 游戏是否结束
+        :param episode_start: 这条记录之前，agent的状态是否刚被重置（重置后的状态由全0的帧组成）
         '''
-        # 因为deque初始化时指定了maxlen，所以在回放池装满的情况下添加新回放记录时，最旧的记录会自动删除
-        self.memory.append((current_state, action, reward, next_state, terminal))
+        index = self.position
+        self.frames[index] = np.packbits(frame, axis=None)
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.terminals[index] = terminal
+        if episode_start or self.size == 0:
+            self.episode_steps[index] = 0
+        else:
+            self.episode_steps[index] = min(self.episode_steps[index - 1] + 1, self.history_length)
 
-    def sample(self, batch_size):
+        self.position = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size, state_out=None, next_state_out=None):
         '''
         从回放池中随机取出一部分数据
+
+        :param state_out: 可选，预先分配好的数组，用于存放state_batch（写入时转换为该数组的数据类型）
+        :param next_state_out: 可选，预先分配好的数组，用于存放next_state_batch
+        :returns state_batch, action_batch, reward_batch, next_state_batch, terminal_batch
         '''
-        return random.sample(self.memory, batch_size)
+        # 回放池装满后，最旧的几条记录拼接状态时需要的帧已被新记录覆盖，不参与采样
+        if self.size == self.capacity:
+            start, count = self.position + self.history_length, self.size - self.history_length
+        else:
+            start, count = 0, self.size
+        # 有放回地随机抽取记录的位置，一次生成全部索引，不必逐个处理Python对象
+        index = (start + np.random.randint(0, count, size=batch_size)) % self.capacity
+
+        # 一次取出每条记录及其之前的history_length帧，属于上一个episode的帧置为0
+        packed_frames = self.frames[(index[:, np.newaxis] - self.history_offset) % self.capacity]
+        frames = np.unpackbits(packed_frames, axis=-1, count=self.frame_size).reshape(
+            packed_frames.shape[:2] + self.frame_shape)
+        frames[self.history_offset > self.episode_steps[index][:, np.newaxis]] = 0
+
+        state_batch, next_state_batch = frames[:, :-1], frames[:, 1:]
+        if state_out is not None:
+            np.copyto(state_out, state_batch)
+            state_batch = state_out
+        if next_state_out is not None:
+            np.copyto(next_state_out, next_state_batch)
+            next_state_batch = next_state_out
+
+        return (state_batch, self.actions[index], self.rewards[index],
+                next_state_batch, self.terminals[index])
 
     def __len__(self):
-        return len(self.memory)
+        return self.size
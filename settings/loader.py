@@ -62,6 +62,10 @@ class TrainingSettingLoader:
         if isinstance(resume, bool):
             self.setting.resume = resume
 
+        torch_compile = json_dict.get('torch_compile', None)
+        if isinstance(torch_compile, bool):
+            self.setting.torch_compile = torch_compile
+
         test_model_freq = json_dict.get('test_model_freq', None)
         if test_model_freq:
             if 0 < test_model_freq:
@@ -72,6 +76,11 @@ class TrainingSettingLoader:
             if 0 < save_checkpoint_freq:
                 self.setting.save_checkpoint_freq = save_checkpoint_freq
 
+        train_freq = json_dict.get('train_freq', None)
+        if train_freq:
+            if 0 < train_freq:
+                self.setting.train_freq = train_freq
+
         update_target_qnetwork_freq = json_dict.get('update_target_qnetwork_freq', None)
         if update_target_qnetwork_freq:
             if 0 < update_target_qnetwork_freq:
@@ -143,6 +152,10 @@ class TrainingSettingLoader:
         if isinstance(resume, bool):
             self.setting.resume = resume
 
+        torch_compile = args.torch_compile
+        if isinstance(torch_compile, bool):
+            self.setting.torch_compile = torch_compile
+
         test_model_freq = args.test_model_freq
         if test_model_freq:
             if 0 < test_model_freq:
@@ -153,6 +166,11 @@ class TrainingSettingLoader:
             if 0 < save_checkpoint_freq:
                 self.setting.save_checkpoint_freq = save_checkpoint_freq
 
+        train_freq = args.train_freq
+        if train_freq:
+            if 0 < train_freq:
+                self.setting.train_freq = train_freq
+
         exploration = args.exploration
         if exploration:
             if 0 < exploration:
@@ -196,9 +214,11 @@ class DefaultTrainingSetting:
         self.observation = 100
         self.max_episode = 20000
         self.resume = False
+        self.torch_compile = False
         self.test_model_freq = 100
         self.save_checkpoint_freq = 2000
         self.update_target_qnetwork_freq = 10
+        self.train_freq = 4
         self.exploration = 10000
         self.exploration_method = 'Epsilon Greedy'
         self.epsilon_greedy = self.EpsilonGreedy()